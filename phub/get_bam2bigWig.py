@@ -4,15 +4,17 @@
 
 Functions:
     _get_args
+    _run_one
 """
 
 import sys
 import os
-import glob
-import re
+import shlex
+import fnmatch
 import argparse
 import logging
-import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
 
 import phub.utils as utils
 
@@ -21,21 +23,25 @@ logger = logging.getLogger(__name__)
         
 def _get_args(args):
     
-    from collections import defaultdict
-    
-    final_options = defaultdict(list)
-    final_options_str = ''
+    final_options = []
     if args is not None:
         for opt in args:
-            final_options['{}'.format(opt.rsplit()[0].strip('--'))].append(' '.join(opt.rsplit()[1:]))
-
-        final_options_str = ' '.join(['--{} {}'.format(key, val) for (key, values) in
-                                      final_options.items() for val in values])
-    return final_options_str
+            # quoted values are kept together, as with a shell
+            option, *values = shlex.split(opt)
+            final_options.append('--{}'.format(option.lstrip('-')))
+            final_options.extend(values)
+    return final_options
 
 
-def _glob_re(pattern, strings):
-        return filter(re.compile(pattern).match, strings)
+def _run_one(task):
+    # input files have already been checked
+    cmd, out_files, in_files, overwrite = task
+    return utils.call_if_not_exists(cmd,
+                                    out_files,
+                                    in_files=in_files,
+                                    overwrite=overwrite,
+                                    call=True,
+                                    existing_in_files=set(in_files))
 
 
 def main():
@@ -53,12 +59,12 @@ def main():
     
     
     parser.add_argument('-fmt', '--input-format', help="""The 'type' of input, either 'glob', 
-        'txt', or 'yaml' file. With 'glob', regex pattern can be specified with [--pattern].
+        'txt', or 'yaml' file. With 'glob', shell-style patterns can be given with [--pattern].
         With 'yaml', the key must be specified with [--key].""", type=str, 
         choices=['glob', 'txt', 'yaml'], default='glob')
 
-    parser.add_argument('--pattern', help="""A comma-separated list of patterns used to glob
-        BAM files.""", default='', type=str, nargs='*')
+    parser.add_argument('--pattern', help="""A space-separated list of patterns (shell-style 
+        wildcards) used to select BAM files.""", default='', type=str, nargs='*')
     
     parser.add_argument('--key', help="""The key to access the list of files if using
         a yaml input file.""", default='samples', type=str)
@@ -68,9 +74,18 @@ def main():
         to bamCoverage (deepTools). Each option must be quoted separately as in 
         "--option value", using soft quotes, where '--option' is the long parameter name, 
         and 'value' is the value given to this parameter. There is no check on the validity
-        of arguments.""", nargs='*', type=str)
+        of arguments. The number of processors is set with [--threads-per-job].""", 
+        nargs='*', type=str)
+    
+    parser.add_argument('--ignore-duplicates', help="""If this flag is present then reads
+        that have the same orientation and start position are considered only once
+        (bamCoverage --ignoreDuplicates).""", action='store_true')
+    
+    parser.add_argument('--threads-per-job', help="""The number of processors used by each
+        bamCoverage call (--numberOfProcessors).""", type=int, default=1)
   
     utils.add_file_options(parser)
+    utils.add_parallel_options(parser)
     utils.add_logging_options(parser)
     args = parser.parse_args()
     utils.update_logging(args)
@@ -89,22 +104,28 @@ def main():
         msg = "Invalid output path or wrong permission: {}. Terminating.".format(args.outputDir)
         raise OSError(msg)
     
-    # get bamCoverage arguments
+    # get bamCoverage arguments, common to all files
     bamc_args = _get_args(args.dt_options)
+    base_cmd = ['bamCoverage', '-of', 'bigwig', '-p', str(args.threads_per_job)]
+    if args.ignore_duplicates:
+        base_cmd.append('--ignoreDuplicates')
+    base_cmd.extend(bamc_args)
     
-    # input format - fetch BAM files
+    # input format - fetch BAM files, files found with glob are known to exist
+    found = set()
     if args.input_format == 'glob': 
-        filenames = list(_glob_re(r'.*(bam$)', os.listdir(args.inputDir)))
-        match = r'.*({}).*'.format('|'.join(args.pattern))
-        filenames = list(_glob_re(match, filenames))
-        filenames = [os.path.join(args.inputDir, f) for f in filenames]
+        patterns = ['*{}*'.format(p) for p in args.pattern] or ['*']
+        with os.scandir(args.inputDir) as it:
+            filenames = [e.path for e in it 
+                         if e.name.endswith('.bam') and e.is_file()
+                         and any(fnmatch.fnmatchcase(e.name, p) for p in patterns)]
+        found = set(filenames)
     elif args.input_format == 'txt':
-        filenames = pd.read_csv(args.inputDir,
-                                header=None,
-                                usecols=[0],
-                                names=['f']).f.to_list()
+        # first (comma-separated) field of each line, no header
+        with open(args.inputDir) as f:
+            filenames = [line.split(',')[0].strip() for line in f if line.strip()]
     elif args.input_format == 'yaml':
-        config = yaml.load(open(args.inputDir), Loader=yaml.FullLoader)
+        config = utils.load_yaml(args.inputDir)
         try:
             filenames = list(config[args.key].values())
             fileMapping = config[args.key]
@@ -119,22 +140,26 @@ def main():
             outputFile = os.path.splitext(os.path.basename(f))[0]
             fileMapping[outputFile] = f
     
+    tasks = []
     for bigWig, bam in fileMapping.items():
-        if not os.path.exists(bam):
+        if bam not in found and not os.path.exists(bam):
             msg = "Could not find the BAM file: {}. Terminating.".format(bam)
             raise FileNotFoundError(msg)        
         
         filename = os.path.join(args.outputDir, '{}.bw'.format(bigWig))
+        if os.path.exists(filename) and not args.overwrite:
+            msg = "Output file {} already exists. Skipping.".format(filename)
+            logger.warning(msg)
+            continue
         in_files = [bam]
         out_files = [filename]
-        cmd = 'bamCoverage -b {} -o {} -of bigwig {}'.format(bam,
-                                                             filename,
-                                                             bamc_args) 
-        utils.call_if_not_exists(cmd,
-                                 out_files,
-                                 in_files=in_files,
-                                 overwrite=args.overwrite,
-                                 call=True)
+        cmd = base_cmd + ['-b', bam, '-o', filename]
+        tasks.append((cmd, out_files, in_files, args.overwrite))
+    
+    # each BAM file is independent, bamCoverage runs in a separate process, 
+    # so threads are enough to run up to [--jobs] bamCoverage at once
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        list(executor.map(_run_one, tasks))
     
 
 if __name__ == '__main__':
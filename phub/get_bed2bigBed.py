@@ -9,9 +9,12 @@ Note: Requires the executable "bedToBigBed" and the "chrom.sizes"
       passing the right options.
 
 Functions:
-    _glob_re
     _read_bed
+    _has_fields
+    _sort_bed
     _get_bed
+    _read_bed_polars
+    _get_bed_polars
     _convert
 """
 
@@ -19,13 +22,13 @@ import sys
 import os
 import argparse
 import logging
-import yaml
 import json
-import csv
-import gzip
-import re
+import shlex
+import fnmatch
+import subprocess
+import importlib.util
 
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import phub.utils as utils
 
@@ -56,65 +59,149 @@ default_fields = [
     "thickStart", "thickEnd", "itemRgb", "blockCount", "blockSizes", "chromStarts"
 ]
 
-
-def _glob_re(pattern, strings):
-    return filter(re.compile(pattern).match, strings)
+# pandas dtypes for standard fields, others are inferred
+default_dtypes = {
+    "chrom": 'category', "chromStart": 'uint32', "chromEnd": 'uint32', 
+    "strand": 'category', "thickStart": 'uint32', "thickEnd": 'uint32'
+}
 
 
 def _read_bed(filename, header, args, sep='\t', **kwargs):
     
     """Reads a BED file into a pandas data frame. This function assumes that 
     field names are prepended with a comment character (see pbio). Otherwise
-    a header is added as specified.
+    a header is added as specified. Only fields in header are read.
     """
     
+    # pandas is only imported when needed
+    import pandas as pd
+    
     if not args.no_header:
-        bed = pd.read_csv(filename, sep=sep, **kwargs)
+        dtype = {}
+        for field, field_dtype in default_dtypes.items():
+            dtype[field] = field_dtype
+            dtype['#{}'.format(field)] = field_dtype
+        bed = pd.read_csv(filename, 
+                          sep=sep, 
+                          usecols=lambda c: c.replace("#", "") in header,
+                          dtype=dtype,
+                          **kwargs)
         bed.columns = [c.replace("#", "") for c in bed.columns]
     else: 
-        bed = pd.read_csv(filename, sep=sep, header=None, **kwargs)
+        dtype = {i: default_dtypes[field] for i, field in enumerate(header)
+                 if field in default_dtypes}
+        bed = pd.read_csv(filename, 
+                          sep=sep, 
+                          header=None, 
+                          usecols=range(len(header)),
+                          dtype=dtype,
+                          **kwargs)
         num_columns = len(bed.columns)
         bed.columns = header[:num_columns]
 
     # either way, make sure the first column (chrom) is treated as a string
     chrom_name = bed.columns[0]
     chrom_column = bed[chrom_name]
-    bed[chrom_name] = chrom_column.astype(str)
+    if chrom_column.dtype.name != 'category':
+        bed[chrom_name] = chrom_column.astype(str).astype('category')
 
     return bed
 
 
+def _has_fields(filename, fields, args):
+    
+    """Check if the fields of a BED file are exactly the given fields,
+    using only the first line (header, or first record if no header).
+    """
+    
+    first = utils.read_first_line(filename)
+    
+    if not args.no_header:
+        return [c.replace("#", "") for c in first] == fields
+    return len(first) == len(fields)
+
+
+def _sort_bed(filename, output_filename, args):
+    
+    """Sort a BED file as required by bedToBigBed, without any other change,
+    using the stand-alone sort program.
+    """
+    
+    tmp = os.path.join(args.outputDir, '{}.bed'.format(output_filename))
+    
+    cat = 'gzip -dc' if filename.endswith('gz') else 'cat'
+    skip_header = '' if args.no_header else ' | tail -n +2'
+    pipeline = "{} {}{} | LC_ALL=C sort -k1,1 -k2,2n > {}".format(cat,
+                                                                 shlex.quote(filename),
+                                                                 skip_header,
+                                                                 shlex.quote(tmp))
+    # with pipefail, the pipeline fails if any step fails, e.g. if the 
+    # input cannot be decompressed, and not only if sort fails
+    cmd = ['bash', '-o', 'pipefail', '-c', pipeline]
+    
+    # the input file has already been checked, see main
+    try:
+        utils.call_if_not_exists(cmd,
+                                 tmp,
+                                 in_files=[filename],
+                                 overwrite=args.overwrite,
+                                 call=True,
+                                 existing_in_files={filename})
+    except subprocess.CalledProcessError:
+        # do not leave an empty or truncated file behind, it would be 
+        # used as is on the next run
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    
+    return tmp
+    
+
 def _get_bed(filename, output_filename, fields_to_keep, args):
 
-    """Get BED12+ file and adjust features.
+    """Get BED12+ file and adjust features. If the file only needs to be
+    sorted, this is delegated to _sort_bed, otherwise if polars is installed,
+    this is delegated to _get_bed_polars.
     """
 
+    # nothing to adjust if the input already has the fields to keep
+    if (args.keep_color and not (args.add_chr or args.chr_map)
+            and _has_fields(filename, fields_to_keep, args)):
+        return _sort_bed(filename, output_filename, args)
+    
+    # polars (or pandas) is only imported when needed
+    if importlib.util.find_spec('polars') is not None:
+        return _get_bed_polars(filename, output_filename, fields_to_keep, args)
+    
     bed = _read_bed(filename, fields_to_keep, args)
     
     # get fields
     header = list(bed.columns)
     chromField = header[0]
     startField = header[1]
-    colorField = header[8]
+    # only fields_to_keep are read, the color field is the 9th field of 
+    # the file, if it is kept
+    if args.no_header:
+        fields = fields_to_keep
+    else:
+        fields = [c.replace("#", "") for c in utils.read_first_line(filename)]
+    colorField = None
+    if len(fields) > 8 and fields[8] in header:
+        colorField = fields[8]
     
-    # adjust chrom field
+    # adjust chrom field (categorical, only categories are re-written)
     if args.add_chr:
-        bed[chromField] = 'chr' + bed[chromField].astype(str)
-    if args.chr_dict:
-        for chrom_old, chrom_new in args.chr_dict.items():
-            seqname_m = bed[chromField] == str(chrom_old)
-            bed.loc[seqname_m, chromField] = str(chrom_new)
-    if args.chr_file:
-        chr_map = pd.read_csv(args.chr_file, 
-                              header=None,
-                              index_col=0, 
-                              squeeze=True).to_dict()
-        bed.replace({chromField: chr_map}, inplace=True)
-
-    # sort on the chrom field, and then on the chromStart field.
+        bed[chromField] = bed[chromField].cat.rename_categories('chr{}'.format)
+    if args.chr_map:
+        bed[chromField] = utils.map_chrom(bed[chromField], args.chr_map)
+
+    # sort on the chrom field, and then on the chromStart field, categories
+    # are compared using their codes, so make sure these follow the names
+    chrom_column = bed[chromField]
+    bed[chromField] = chrom_column.cat.reorder_categories(sorted(chrom_column.cat.categories))
     bed.sort_values([chromField, startField], ascending=[True, True], inplace=True)
 
-    if args.keep_color:
+    if args.keep_color or colorField is None:
         # color field must be a string
         pass
     else:
@@ -129,15 +216,77 @@ def _get_bed(filename, output_filename, fields_to_keep, args):
         msg = "Temporary output file {} already exists. Skipping.".format(tmp)
         logger.warning(msg)
     else:
-        bed.to_csv(tmp,
-                   sep='\t',
-                   index=False,
-                   header=False,
-                   quoting=csv.QUOTE_NONE)
+        utils.to_csv(bed, tmp)
     
     return tmp
 
 
+def _read_bed_polars(filename, header, args, sep='\t'):
+    
+    """Reads a BED file into a polars data frame, see _read_bed. All fields
+    are read as strings (types are not inferred, e.g. chrom can be numeric 
+    for the first rows only), and the coordinates (chromStart, chromEnd) 
+    are then cast to integers.
+    """
+    
+    import polars as pl
+    
+    if not args.no_header:
+        bed = pl.read_csv(filename, separator=sep, infer_schema_length=0)
+        bed = bed.rename({c: c.replace("#", "") for c in bed.columns})
+    else:
+        bed = pl.read_csv(filename, separator=sep, has_header=False, 
+                          columns=list(range(len(header))),
+                          infer_schema_length=0)
+        bed.columns = header
+
+    return bed.with_columns(pl.col(bed.columns[1:3]).cast(pl.Int64))
+
+
+def _get_bed_polars(filename, output_filename, fields_to_keep, args):
+
+    """Get BED12+ file and adjust features, same as _get_bed, but using 
+    polars (multi-threaded parsing and sort).
+    """
+
+    import polars as pl
+
+    bed = _read_bed_polars(filename, fields_to_keep, args)
+    
+    # get fields
+    header = bed.columns
+    chromField = header[0]
+    startField = header[1]
+    colorField = header[8] if len(header) > 8 else None
+    
+    # adjust chrom field
+    if args.add_chr:
+        bed = bed.with_columns(pl.concat_str([pl.lit('chr'), pl.col(chromField)]).alias(chromField))
+    if args.chr_map:
+        bed = bed.with_columns(pl.col(chromField).replace(args.chr_map))
+
+    # sort on the chrom field, and then on the chromStart field.
+    bed = bed.sort([chromField, startField])
+
+    if not (args.keep_color or colorField is None):
+        bed = bed.with_columns(pl.lit('64,64,64').alias(colorField))
+
+    # remove unused fields
+    bed = bed.select(fields_to_keep)
+
+    # write bed file to output directory
+    tmp = os.path.join(args.outputDir, '{}.bed'.format(output_filename))
+    if os.path.exists(tmp) and not args.overwrite:
+        msg = "Temporary output file {} already exists. Skipping.".format(tmp)
+        logger.warning(msg)
+    else:
+        bed.write_csv(tmp,
+                      separator='\t',
+                      include_header=False,
+                      quote_style='never')
+    
+    return tmp
+
 
 def _convert(bed, bb, use_config_fields, args):
 
@@ -154,12 +303,15 @@ def _convert(bed, bb, use_config_fields, args):
     else:
         cmd = "bedToBigBed {} {} {}".format(bed, args.chrSizes, bb)
 
+    # input files have already been checked (or written), see main
     utils.call_if_not_exists(cmd,
                              out_files,
                              in_files=in_files,
                              overwrite=args.overwrite,
-                             call=True)
-    if not args.keep:
+                             call=True,
+                             existing_in_files=set(in_files))
+    # only temporary files are removed, not the input files [--skip]
+    if not (args.keep or args.skip):
         try:
             os.remove(bed)
             msg = "Removing: {}".format(bed)
@@ -189,12 +341,12 @@ def main():
 
 
     parser.add_argument('-fmt', '--input-format', help="""The 'type' of input, either 'glob', 
-        'txt', or 'yaml' file. With 'glob', regex pattern can be specified with [--pattern].
+        'txt', or 'yaml' file. With 'glob', shell-style patterns can be given with [--pattern].
         With 'yaml', the key must be specified with [--key].""", type=str, 
         choices=['glob', 'txt', 'yaml'], default='glob')
 
-    parser.add_argument('--pattern', help="""A comma-separated list of patterns used to glob
-        BED files.""", default='', type=str, nargs='*')
+    parser.add_argument('--pattern', help="""A space-separated list of patterns (shell-style 
+        wildcards) used to select BED files.""", default='', type=str, nargs='*')
     
     parser.add_argument('--key', help="""The key to access the list of files if using
         a yaml input file.""", default='samples', type=str)
@@ -241,6 +393,7 @@ def main():
         required=any(item in ['--keep-color', '--extra-index'] for item in sys.argv))
 
     utils.add_file_options(parser)
+    utils.add_parallel_options(parser)
     utils.add_logging_options(parser)
     args = parser.parse_args()
     utils.update_logging(args)
@@ -250,6 +403,9 @@ def main():
     
     # check that stand-alone executable(s) are callable
     programs = ['bedToBigBed']
+    # BED files that only need to be sorted are sorted in a shell pipeline, see _sort_bed
+    if args.keep_color and not args.skip:
+        programs.extend(['bash', 'cat', 'gzip', 'tail', 'sort'])
     utils.check_programs_exist(programs)
     
     # check output path
@@ -259,19 +415,29 @@ def main():
         msg = "Invalid output path or wrong permission: {}. Terminating.".format(args.outputDir)
         raise OSError(msg)    
     
-    # input format - fetch BED files
+    # check chrom.sizes, once for all files
+    if not os.path.exists(args.chrSizes):
+        msg = "Could not find the chrom.sizes file: {}. Terminating.".format(args.chrSizes)
+        raise FileNotFoundError(msg)
+    
+    # sequence names mapping, once for all BED files
+    args.chr_map = utils.get_chr_map(args)
+    
+    # input format - fetch BED files, files found with glob are known to exist
+    found = set()
     if args.input_format == 'glob': 
-        filenames = list(_glob_re(r'.*(bed|bed.gz)', os.listdir(args.inputDir)))
-        match = r'.*({}).*'.format('|'.join(args.pattern))
-        filenames = list(_glob_re(match, filenames))
-        filenames = [os.path.join(args.inputDir, f) for f in filenames]
+        patterns = ['*{}*'.format(p) for p in args.pattern] or ['*']
+        with os.scandir(args.inputDir) as it:
+            filenames = [e.path for e in it 
+                         if e.name.endswith(('.bed', '.bed.gz')) and e.is_file()
+                         and any(fnmatch.fnmatchcase(e.name, p) for p in patterns)]
+        found = set(filenames)
     elif args.input_format == 'txt':
-        filenames = pd.read_csv(args.inputDir,
-                                header=None,
-                                usecols=[0],
-                                names=['f']).f.to_list()
+        # first (comma-separated) field of each line, no header
+        with open(args.inputDir) as f:
+            filenames = [line.split(',')[0].strip() for line in f if line.strip()]
     elif args.input_format == 'yaml':
-        config = yaml.load(open(args.inputDir), Loader=yaml.FullLoader)
+        config = utils.load_yaml(args.inputDir)
         try:
             filenames = list(config[args.key].values())
             fileMapping = config[args.key]
@@ -299,13 +465,9 @@ def main():
         logger.info(msg)
         fields_to_keep = []
         extra_fields = []
-        f = open(args.configure_fields, 'r')
-        lines = f.readlines()
-        f.close()
-        f = open(str(as_file), 'w')
-        f.write("{} {}\n".format("table", "bedSourceSelectedFields"))
-        f.write('''"{}"\n'''.format("Browser extensible data selected fields."))
-        f.write("{}\n".format("("))
+        as_fields = []
+        with open(args.configure_fields, 'r') as f:
+            lines = f.readlines()
         n_fields = 0
         for line_no, line in enumerate(lines):
             l = line.strip()
@@ -314,18 +476,21 @@ def main():
                 break
             fields = l.split(',')
             fields_to_keep.append(fields[0])
-            f.write("{}\t{};\t{}\n".format(fields[1], fields[2], fields[3]))
+            as_fields.append("{}\t{};\t{}\n".format(fields[1], fields[2], fields[3]))
         bed_type = "bed" + str(len(fields_to_keep))
         if n_fields:
             for line in lines[n_fields+1:]:
                 l = line.strip()
                 fields = l.split(',')
                 extra_fields.append(fields[0])
-                f.write("{}\t{};\t{}\n".format(fields[1], fields[2], fields[3]))
+                as_fields.append("{}\t{};\t{}\n".format(fields[1], fields[2], fields[3]))
             bed_type += "+" + str(len(extra_fields))
             fields_to_keep += extra_fields
-        f.write("{}\n".format(")"))
-        f.close()
+        # write the table at once
+        with open(as_file, 'w') as f:
+            f.write('table bedSourceSelectedFields\n'
+                    '"Browser extensible data selected fields."\n'
+                    '(\n{})\n'.format(''.join(as_fields)))
         use_config_fields['bed_type'] = bed_type
     else:
         msg = """Using default fields for BED12."""
@@ -335,28 +500,48 @@ def main():
         use_config_fields['bed_type'] = 'bed12'
         fields_to_keep = default_fields
         
-    # convert to bigBed directly...
-    if args.skip:
-        msg = """Using [--skip] and directly converting input files!"""
-        for newBed, oldBed in fileMapping.items():
-            if not os.path.exists(oldBed):
-                msg = "Could not find the BED file: {}. Terminating.".format(oldBed)
-                raise FileNotFoundError(msg)
-            _convert(oldBed, 
-                     os.path.join(args.outputDir, '{}.bb'.format(newBed)), 
-                     use_config_fields, 
-                     args)
-    #... or prepare BED files prior to convert to bigBed.
-    else:
-        for newBed, oldBed in fileMapping.items():
-            if not os.path.exists(oldBed):
-                msg = "Could not find the BED file: {}. Terminating.".format(oldBed)
-                raise FileNotFoundError(msg)
-            filename = _get_bed(oldBed, newBed, fields_to_keep, args)
-            _convert(filename, 
-                     os.path.join(args.outputDir, '{}.bb'.format(newBed)), 
-                     use_config_fields, 
-                     args)
+    # bedToBigBed runs in a separate process, so threads are enough to convert 
+    # up to [--jobs] files at once, while the next BED file is being prepared
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        # convert to bigBed directly...
+        if args.skip:
+            msg = """Using [--skip] and directly converting input files!"""
+            for newBed, oldBed in fileMapping.items():
+                if oldBed not in found and not os.path.exists(oldBed):
+                    msg = "Could not find the BED file: {}. Terminating.".format(oldBed)
+                    raise FileNotFoundError(msg)
+                bigBed = os.path.join(args.outputDir, '{}.bb'.format(newBed))
+                if os.path.exists(bigBed) and not args.overwrite:
+                    msg = "Output file {} already exists. Skipping.".format(bigBed)
+                    logger.warning(msg)
+                    continue
+                futures.append(executor.submit(_convert, 
+                                               oldBed, 
+                                               bigBed, 
+                                               use_config_fields, 
+                                               args))
+        #... or prepare BED files prior to convert to bigBed.
+        else:
+            for newBed, oldBed in fileMapping.items():
+                if oldBed not in found and not os.path.exists(oldBed):
+                    msg = "Could not find the BED file: {}. Terminating.".format(oldBed)
+                    raise FileNotFoundError(msg)
+                # check before re-writing the BED file
+                bigBed = os.path.join(args.outputDir, '{}.bb'.format(newBed))
+                if os.path.exists(bigBed) and not args.overwrite:
+                    msg = "Output file {} already exists. Skipping.".format(bigBed)
+                    logger.warning(msg)
+                    continue
+                filename = _get_bed(oldBed, newBed, fields_to_keep, args)
+                futures.append(executor.submit(_convert, 
+                                               filename, 
+                                               bigBed, 
+                                               use_config_fields, 
+                                               args))
+        
+        for future in as_completed(futures):
+            future.result()
 
 
 if __name__ == '__main__':
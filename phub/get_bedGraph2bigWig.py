@@ -9,21 +9,25 @@ Note: Requires the executable "bedGraphToBigWig" and the "chrom.sizes"
       passing the right options.
 
 Functions:
-    _glob_re
     _read_bed
     _get_bed
+    _write_bed
     _convert
+    _run_one
+    _run_worker
 """
 
 import sys
 import os
-import glob
 import re
+import fnmatch
 import argparse
 import logging
-import yaml
-import csv
 import json
+import itertools
+import importlib.util
+
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 
@@ -40,86 +44,109 @@ BEDGRAPH_FIELDS = default_fields[0:3]
 BEDGRAPH_FIELDS.extend(['dataValue'])
 
 
-def _glob_re(pattern, strings):
-    return filter(re.compile(pattern).match, strings)
-
-
-def _read_bed(filename, header, args, sep='\t', **kwargs):
+def _read_bed(filename, names, usecols, dtype, args, sep='\t'):
     
-    """Reads a BED/bedGraph file into a pandas data frame. This function assumes that 
-    field names are prepended with a comment character (see pbio). Otherwise
-    a header is added as specified.
+    """Reads selected fields (usecols, by position) of a BED/bedGraph file into
+    a pandas data frame, using the given dtypes (by position). Field names are 
+    given by names. If the file has a header (field names prepended with a
+    comment character, see pbio), it is skipped. Compressed files are read 
+    with polars, if installed, which decompresses natively.
     """
     
-    if not args.no_header:
-        bed = pd.read_csv(filename, sep=sep, **kwargs)
-        bed.columns = [c.replace("#", "") for c in bed.columns]
+    usecols = sorted(set(usecols))
+    skiprows = 0 if args.no_header else 1
+    # polars (and pyarrow, for the conversion to pandas) is optional, and 
+    # only imported when needed
+    if (filename.endswith('gz') 
+            and importlib.util.find_spec('polars') is not None
+            and importlib.util.find_spec('pyarrow') is not None):
+        import polars as pl
+
+        bed = pl.read_csv(filename, 
+                          separator=sep, 
+                          has_header=False, 
+                          skip_rows=skiprows,
+                          columns=usecols,
+                          infer_schema_length=0)
+        # all fields are read as strings (e.g. chrom may look numeric for 
+        # the first rows only), and then converted to dtype
+        bed = bed.to_pandas()
+        bed.columns = usecols
+        bed = bed.astype(dtype)
     else:
-        bed = pd.read_csv(filename, sep=sep, header=None, **kwargs)
-        num_columns = len(bed.columns)
-        bed.columns = header[:num_columns]
-
-    # either way, make sure the first column (chrom) is treated as a string
-    chrom_name = bed.columns[0]
-    chrom_column = bed[chrom_name]
-    bed[chrom_name] = chrom_column.astype(str)
+        bed = pd.read_csv(filename, 
+                          sep=sep, 
+                          header=None, 
+                          skiprows=skiprows,
+                          usecols=usecols,
+                          dtype=dtype)
+    bed.columns = [names[i] for i in usecols]
 
     return bed
 
 
-def _get_bed(filename, output_filename, args, strand=None):
+def _get_bed(filename, args, split_strand=False):
 
-    """Get BED/bedGraph file and adjust features.
+    """Get BED/bedGraph file and adjust features. If split_strand is True, 
+    the strand field is kept (last field), to split features by strand.
     """
 
-    bed = _read_bed(filename, BEDGRAPH_FIELDS, args)
+    if args.no_header:
+        # standard fields, with the data value in place of the name
+        names = BEDGRAPH_FIELDS + default_fields[4:]
+    else:
+        names = [c.replace("#", "") for c in utils.read_first_line(filename)]
     
-    # get fields
-    header = list(bed.columns)
-    chromField = header[0]
-    startField = header[1]
-    endField = header[2]
-    dataValueField = header[3]
-    strandField = header[5]
+    # only read the fields that are used
+    value = 3
     if args.value_field is not None:
-        dataValueField = args.value_field
-    fields_to_keep = [chromField, startField, endField, dataValueField]
+        value = names.index(args.value_field)
+    usecols = [0, 1, 2, value]
+    dtype = {0: 'category', 1: 'int64', 2: 'int64', value: 'float32'}
+    if split_strand:
+        usecols.append(5)
+        dtype[5] = 'category'
+    bed = _read_bed(filename, names, usecols, dtype, args)
     
-    # split if strand is given
-    if strand is not None:
-        bed = bed[bed[strandField]==strand]
+    # get fields
+    chromField = names[0]
+    startField = names[1]
+    endField = names[2]
+    dataValueField = names[value]
+    fields_to_keep = [chromField, startField, endField, dataValueField]
+    if split_strand:
+        fields_to_keep.append(names[5])
               
-    # adjust chrom field
+    # adjust chrom field (categorical, only categories are re-written)
     if args.add_chr:
-        bed[chromField] = 'chr' + bed[chromField].astype(str)
-    if args.chr_dict:
-        for chrom_old, chrom_new in args.chr_dict.items():
-            seqname_m = bed[chromField] == str(chrom_old)
-            bed.loc[seqname_m, chromField] = str(chrom_new)
-    if args.chr_file:
-        chr_map = pd.read_csv(args.chr_file, 
-                              header=None,
-                              index_col=0, 
-                              squeeze=True).to_dict()
-        bed.replace({chromField: chr_map}, inplace=True)
-
-    # sort on the chrom field, and then on the chromStart field.
+        bed[chromField] = bed[chromField].cat.rename_categories('chr{}'.format)
+    if args.chr_map:
+        bed[chromField] = utils.map_chrom(bed[chromField], args.chr_map)
+
+    # sort on the chrom field, and then on the chromStart field, categories
+    # are compared using their codes, so make sure these follow the names
+    chrom_column = bed[chromField]
+    bed[chromField] = chrom_column.cat.reorder_categories(sorted(chrom_column.cat.categories))
     bed.sort_values([chromField, startField], ascending=[True, True], inplace=True)
 
     # remove unused fields
     bed = bed[fields_to_keep]
+    
+    return bed
 
-    # write bedGraph file to output directory
-    tmp = os.path.join(args.outputDir, '{}.bedGraph'.format(output_filename))
+
+def _write_bed(bed, output_filename, args):
+    
+    """Write the first 4 fields of bed to a temporary bedGraph file 
+    in [--tmp-dir].
+    """
+    
+    tmp = os.path.join(args.tmp_dir, '{}.bedGraph'.format(output_filename))
     if os.path.exists(tmp) and not args.overwrite:
         msg = "Temporary output file {} already exists. Skipping.".format(tmp)
         logger.warning(msg)
     else:
-        bed.to_csv(tmp,
-                   sep='\t',
-                   index=False,
-                   header=False,
-                   quoting=csv.QUOTE_NONE)
+        utils.to_csv(bed.iloc[:, 0:4], tmp)
     
     return tmp
 
@@ -131,12 +158,15 @@ def _convert(bg, bw, args):
     cmd = "bedGraphToBigWig {} {} {}".format(bg,
                                              args.chrSizes,
                                              bw)
+    # input files have already been checked (or written), see main
     utils.call_if_not_exists(cmd,
                              out_files,
                              in_files=in_files,
                              overwrite=args.overwrite,
-                             call=True)
-    if not args.keep:
+                             call=True,
+                             existing_in_files=set(in_files))
+    # only temporary files are removed, not the input files [--skip]
+    if not (args.keep or args.skip):
         try:
             os.remove(bg)
             msg = "Removing: {}".format(bg)
@@ -146,6 +176,50 @@ def _convert(bg, bw, args):
             logger.info(msg)
             
             
+def _run_one(newBed, oldBed, args):
+    
+    """Convert one BED/bedGraph file (oldBed) to bigWig (newBed), 
+    either directly [--skip], or via temporary bedGraph file(s).
+    """
+    
+    # convert to bigWig directly...
+    if args.skip:
+        _convert(oldBed, 
+                 os.path.join(args.outputDir, '{}.bw'.format(newBed)),
+                 args)
+    #... or prepare bedGraph files prior to convert to bigWig.
+    else:
+        # read and adjust features once, then split by strand if required
+        split_strand = args.split_strand is not None
+        bed = _get_bed(oldBed, args, split_strand=split_strand)
+        if split_strand:
+            strandField = bed.columns[-1]
+            for strandStr, strand in zip(args.split_strand, ['+', '-']):
+                basename = '{}_{}'.format(newBed, strandStr)
+                filename = _write_bed(bed[bed[strandField]==strand], basename, args)
+                _convert(filename, 
+                         os.path.join(args.outputDir, '{}.bw'.format(basename)), 
+                         args)
+        else:
+            filename = _write_bed(bed, newBed, args)
+            _convert(filename, 
+                     os.path.join(args.outputDir, '{}.bw'.format(newBed)), 
+                     args)
+            
+            
+def _run_worker(newBed, oldBed, args):
+    
+    """Run _run_one in a worker process. Workers exit without calling
+    logging.shutdown, so buffered log records are flushed after each file.
+    """
+    
+    try:
+        _run_one(newBed, oldBed, args)
+    finally:
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+            
+            
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
                                      description="""Convert bedGraph to bigWig files by 
@@ -159,18 +233,18 @@ def main():
         yaml file is used, in which case the key:value pair is used to assign names.""")
     
     parser.add_argument('outputDir', help="""The output directory. All bedGraph files are 
-        also temporarily re-written to this location.""")
+        also temporarily re-written to this location, unless [--tmp-dir] is given.""")
 
     parser.add_argument('chrSizes', help="The 'chrom.sizes' file for the UCSC database.")
 
     
     parser.add_argument('-fmt', '--input-format', help="""The 'type' of input, either 'glob', 
-        'txt', or 'yaml' file. With 'glob', regex pattern can be specified with [--pattern].
+        'txt', or 'yaml' file. With 'glob', shell-style patterns can be given with [--pattern].
         With 'yaml', the key must be specified with [--key].""", type=str, 
         choices=['glob', 'txt', 'yaml'], default='glob')
 
-    parser.add_argument('--pattern', help="""A comma-separated list of patterns used to glob
-        BED files.""", default='', type=str, nargs='*')
+    parser.add_argument('--pattern', help="""A space-separated list of patterns (shell-style 
+        wildcards) used to select bedGraph files.""", default='', type=str, nargs='*')
     
     parser.add_argument('--key', help="""The key to access the list of files if using
         a yaml input file.""", default='samples', type=str)
@@ -206,8 +280,13 @@ def main():
     
     parser.add_argument('--value-field', help="""For BED4+ files, field name to use as 4th
         field of the bedGraph.""", type=str)
+    
+    parser.add_argument('--tmp-dir', help="""The directory where temporary bedGraph files
+        are written, e.g. a memory-backed file system such as '/dev/shm'. By default, 
+        the output directory is used.""", type=str)
 
     utils.add_file_options(parser)
+    utils.add_parallel_options(parser)
     utils.add_logging_options(parser)
     args = parser.parse_args()
     utils.update_logging(args)
@@ -226,20 +305,37 @@ def main():
         msg = "Invalid output path or wrong permission: {}. Terminating.".format(args.outputDir)
         raise OSError(msg)    
     
+    # check temporary path
+    if args.tmp_dir is None:
+        args.tmp_dir = args.outputDir
+    elif not os.path.isdir(args.tmp_dir):
+        msg = "Invalid temporary path or wrong permission: {}. Terminating.".format(args.tmp_dir)
+        raise OSError(msg)
+    
+    # check chrom.sizes, once for all files
+    if not os.path.exists(args.chrSizes):
+        msg = "Could not find the chrom.sizes file: {}. Terminating.".format(args.chrSizes)
+        raise FileNotFoundError(msg)
+    
+    # sequence names mapping, once for all files
+    args.chr_map = utils.get_chr_map(args)
+    
     # input format - fetch input BED/bedGraph files
+    found = set()
     if args.input_format == 'glob': 
-        match = r'.*({}|{}.gz).*'.format('|'.join(args.extension, args.extension))
-        filenames = list(_glob_re(match, os.listdir(args.inputDir)))
-        match = r'.*({}).*'.format('|'.join(args.pattern))
-        filenames = list(_glob_re(match, filenames))
-        filenames = [os.path.join(args.inputDir, f) for f in filenames]
+        patterns = ['*{}*'.format(p) for p in args.pattern] or ['*']
+        extensions = (args.extension, args.extension + '.gz')
+        with os.scandir(args.inputDir) as it:
+            filenames = [e.path for e in it 
+                         if e.name.endswith(extensions) and e.is_file()
+                         and any(fnmatch.fnmatchcase(e.name, p) for p in patterns)]
+        found = set(filenames)
     elif args.input_format == 'txt':
-        filenames = pd.read_csv(args.inputDir,
-                                header=None,
-                                usecols=[0],
-                                names=['f']).f.to_list()
+        # first (comma-separated) field of each line, no header
+        with open(args.inputDir) as f:
+            filenames = [line.split(',')[0].strip() for line in f if line.strip()]
     elif args.input_format == 'yaml':
-        config = yaml.load(open(args.inputDir), Loader=yaml.FullLoader)
+        config = utils.load_yaml(args.inputDir)
         try:
             filenames = list(config[args.key].values())
             fileMapping = config[args.key]
@@ -259,41 +355,36 @@ def main():
             fileMapping[outputFile] = f
     
     # check [--split-strand] keywords
-    if agrs.split_strand is not None:
+    if args.split_strand is not None:
         match = 'fwd|forward|plus|pos|\+|sense|first'
-        if re.findall(match, agrs.split_strand[1]):
+        if re.findall(match, args.split_strand[1]):
             msg = """Verify the order of [--split-strand FWD REV]! Keywords were detected
             that might not reflect the correct strand..."""
             logger.warning(msg)
     
-    # convert to bigWig directly...
+    # check input files, files found with glob are known to exist
+    for oldBed in fileMapping.values():
+        if oldBed not in found and not os.path.exists(oldBed):
+            msg = "Could not find the bedGraph file: {}. Terminating.".format(oldBed)
+            raise FileNotFoundError(msg)
+    
     if args.skip:
         msg = """Using [--skip] and directly converting input files!"""
+        logger.warning(msg)
+    
+    # each file is independent, process up to [--jobs] files at once, 
+    # logging is set up again in each worker (spawn, forkserver)
+    if args.jobs == 1:
         for newBed, oldBed in fileMapping.items():
-            if not os.path.exists(oldBed):
-                msg = "Could not find the bedGraph file: {}. Terminating.".format(oldBed)
-                raise FileNotFoundError(msg)
-            _convert(oldBed, 
-                     os.path.join(args.outputDir, '{}.bw'.format(newBed)),
-                     args)
-    #... or prepare bedGraph files prior to convert to bigBed.
+            _run_one(newBed, oldBed, args)
     else:
-        for newBed, oldBed in fileMapping.items():
-            if not os.path.exists(oldBed):
-                msg = "Could not find the bedGraph file: {}. Terminating.".format(oldBed)
-                raise FileNotFoundError(msg)
-            if agrs.split_strand is not None:
-                for strandStr, strand in zip(agrs.split_strand, ['+', '-']):
-                    basename = '{}_{}'.format(newBed, strandStr)
-                    filename = _get_bed(oldBed, basename, args, strand=strand)
-                    _convert(filename, 
-                             os.path.join(args.outputDir, '{}.bb'.format(basename)), 
-                             args)
-            else:
-                filename = _get_bed(oldBed, newBed, args)
-                _convert(filename, 
-                         os.path.join(args.outputDir, '{}.bb'.format(newBed)), 
-                         args)
+        with ProcessPoolExecutor(max_workers=args.jobs,
+                                 initializer=utils.update_logging,
+                                 initargs=(args,)) as executor:
+            list(executor.map(_run_worker, 
+                              fileMapping.keys(), 
+                              fileMapping.values(), 
+                              itertools.repeat(args)))
  
 
 if __name__ == '__main__':
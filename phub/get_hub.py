@@ -1,6 +1,9 @@
 #! /usr/bin/env python3
 
 """Create hub components.
+
+Functions:
+    _get_track
 """
 
 import sys
@@ -8,7 +11,6 @@ import os
 import re
 import argparse
 import logging
-import yaml
 
 import trackhub
 
@@ -17,6 +19,23 @@ import phub.utils as utils
 logger = logging.getLogger(__name__)
 
 
+def _get_track(name, source, trackType, gSettings, fSettings):
+    
+    """Define a track, using global settings (gSettings), updated with
+    file-specific settings (fSettings), if any.
+    """
+    
+    finalSettings = {**gSettings, **(fSettings.get(name) or {})}
+    track = trackhub.Track(
+        name=name,
+        source=os.path.basename(source), # track
+        url=os.path.basename(source),
+        tracktype=trackType)
+    track.add_params(**{str(k): str(v) for k, v in finalSettings.items()})
+    
+    return track
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
                                      description="""Wrapper to facilitate the creation of
@@ -45,7 +64,7 @@ def main():
         raise OSError(msg)    
     
     # read configuration file
-    config = yaml.load(open(args.config), Loader=yaml.FullLoader)
+    config = utils.load_yaml(args.config)
     # first check if we have at least one file format defined
     l = [re.search('^big.+?Files$', k) for k in config.keys()]
     if l.count(None) == len(l):
@@ -86,6 +105,7 @@ def main():
     # standard settings - individual tracks and/or tracks grouped with superTrack container
     # check if we have superTracks, else add tracks
     superTracks = {}
+    super_tracks = {}
     if 'superTracks' in config.keys():
         for superTrack, tracks in config['superTracks'].items():
             superTracks[superTrack] = tracks
@@ -98,61 +118,36 @@ def main():
                 short_label=short,
                 long_label=long,
             )    
-            exec('super{}=s'.format(superTrack))
-            exec('trackDb.add_tracks(super{})'.format(superTrack))
+            super_tracks[superTrack] = s
+            trackDb.add_tracks(s)
+        
+    # global settings, once for each file type (trackType is not a parameter)
+    fileTypeSettings = {}
+    for fileType, globalSettings, fileSettings in zip(['bigBedFiles', 'bigWigFiles'], 
+                                                    ['bigBedGlobalSettings', 'bigWigGlobalSettings'],
+                                                    ['bigBedFileSettings', 'bigWigFileSettings']):
+        if fileType in config:
+            gSettings = config[globalSettings].copy()
+            trackType = gSettings.pop('trackType')
+            fSettings = config.get(fileSettings) or {}
+            fileTypeSettings[fileType] = (trackType, gSettings, fSettings)
         
     # first add tracks associated with superTracks, then add remaining tracks if any
     for superTrack, tracks in superTracks.items():
         for track in tracks:
-            for fileType, globalSettings, fileSettings in zip(['bigBedFiles', 'bigWigFiles'], 
-                                                            ['bigBedGlobalSettings', 'bigWigGlobalSettings'],
-                                                            ['bigBedFileSettings', 'bigWigFileSettings']):
+            for fileType, settings in fileTypeSettings.items():
                 if track in config[fileType]:
                     source = config[fileType][track]
-                    gSettings = config[globalSettings].copy()
-                    trackType = gSettings.pop('trackType')
-                    fSettings = config[fileSettings].get(track, None)
-                    if fSettings is not None:
-                        finalSettings = {**gSettings, **fSettings}
-                    else:
-                        finalSettings = gSettings
-                    # define track
-                    track = trackhub.Track(
-                        name=track,
-                        source=os.path.basename(source), # track
-                        url=os.path.basename(source),
-                        tracktype=trackType)
-                    for setting, value in finalSettings.items():
-                        exec("track.add_params({}='{}')".format(setting, value))
                     # add to superTrack
-                    exec('super{}.add_tracks(track)'.format(superTrack))
+                    super_tracks[superTrack].add_tracks(_get_track(track, source, *settings))
 
     # now process tracks not attached to a superTrack      
-    processed = sum(superTracks.values(), [])  
-    for fileType, globalSettings, fileSettings in zip(['bigBedFiles', 'bigWigFiles'], 
-                                                    ['bigBedGlobalSettings', 'bigWigGlobalSettings'],
-                                                    ['bigBedFileSettings', 'bigWigFileSettings']):
-
-        for track in config[fileType]:
+    processed = set(sum(superTracks.values(), []))
+    for fileType, settings in fileTypeSettings.items():
+        for track, source in config[fileType].items():
             if track not in processed:
-                source = config[fileType][track]
-                gSettings = config[globalSettings].copy()
-                trackType = gSettings.pop('trackType')
-                fSettings = config[fileSettings].get(track, None)
-                if fSettings is not None:
-                    finalSettings = {**gSettings, **fSettings}
-                else:
-                    finalSettings = gSettings
-                # define track
-                track = trackhub.Track(
-                    name=track,
-                    source=os.path.basename(source), # track
-                    url=os.path.basename(source),
-                    tracktype=trackType)
-                for setting, value in finalSettings.items():
-                    exec("track.add_params({}='{}')".format(setting, value))
                 # add
-                trackDb.add_tracks(track)    
+                trackDb.add_tracks(_get_track(track, source, *settings))
     
     # TODO: files need to excist to be linked to the staging dir, currently only
     # the hub files/structure is created, so this ends with ValueError: target {} not found.
@@ -7,8 +7,9 @@ installing the whole package here.
 """
 
 
+import functools
 import os
-import subprocess
+import re
 import sys
 
 import logging
@@ -17,6 +18,42 @@ logger = logging.getLogger(__name__)
 
 # parser and logging
 
+_LOGGING_LEVEL_CHOICES = ('NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+_LOGGING_LEVELS = {name: getattr(logging, name) for name in _LOGGING_LEVEL_CHOICES}
+_DEFAULT_LOGGING_LEVEL = 'WARNING'
+_DEFAULT_SPECIFIC_LOGGING_LEVEL = 'NOTSET'
+# (option name, log description)
+_SPECIFIC_LOGGERS = (('file', 'log file'), ('stdout', 'stdout log'), 
+                     ('stderr', 'stderr log'))
+_SPECIFIC_LOGGING_LEVEL_HELP = ("The logging level to be used for the {}, if "
+    "specified. This option overrides --logging-level.")
+
+# logging options (flags, keyword arguments), see add_logging_options
+_LOGGING_ACTIONS = (
+    (('--log-file',), dict(help="This option specifies a file to "
+        "which logging statements will be written (in addition to stdout and "
+        "stderr, if specified)", default="")),
+    (('--log-stdout',), dict(help="If this flag is present, then "
+        "logging statements will be written to stdout (in addition to a file "
+        "and stderr, if specified)", action='store_true')),
+    (('--no-log-stderr',), dict(help="Unless this flag is present, then "
+        "logging statements will be written to stderr (in addition to a file "
+        "and stdout, if specified)", action='store_true')),
+    (('--log-buffer-size',), dict(help="The number of logging "
+        "statements to buffer before writing them; they are also written when a "
+        "statement of level ERROR or above is logged, and at exit. If 0, they "
+        "are written immediately", type=int, default=0)),
+    (('--logging-level',), dict(help="If this value is specified, "
+        "then it will be used for all logs", choices=_LOGGING_LEVEL_CHOICES,
+        default=_DEFAULT_LOGGING_LEVEL)),
+) + tuple(
+    (('--{}-logging-level'.format(name),), dict(
+        help=_SPECIFIC_LOGGING_LEVEL_HELP.format(log), 
+        choices=_LOGGING_LEVEL_CHOICES, 
+        default=_DEFAULT_SPECIFIC_LOGGING_LEVEL)) 
+    for name, log in _SPECIFIC_LOGGERS
+)
+
 
 def add_file_options(parser):
 
@@ -29,6 +66,30 @@ def add_file_options(parser):
         intermediary files are not deleted.""", action='store_true')
 
 
+def _positive_int(value):
+    """ Convert value to a positive integer, for use as argparse type.
+    """
+    import argparse
+
+    try:
+        ivalue = int(value)
+    except ValueError:
+        ivalue = 0
+    if ivalue < 1:
+        msg = "invalid positive int value: '{}'".format(value)
+        raise argparse.ArgumentTypeError(msg)
+    
+    return ivalue
+
+
+def add_parallel_options(parser):
+
+    parallel_options = parser.add_argument_group('parallel options')
+
+    parallel_options.add_argument('-j', '--jobs', help="""The number of files to 
+        process concurrently.""", type=_positive_int, default=1)
+
+
 def add_logging_options(parser, default_log_file=""):
     """ This function add options for logging to an argument parser. In 
         particular, it adds options for logging to a file, stdout and stderr.
@@ -44,36 +105,9 @@ def add_logging_options(parser, default_log_file=""):
 
     logging_options = parser.add_argument_group("logging options")
 
-    default_log_file = ""
-    logging_level_choices = ['NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
-    default_logging_level = 'WARNING'
-    default_specific_logging_level = 'NOTSET'
-
-    logging_options.add_argument('--log-file', help="This option specifies a file to "
-        "which logging statements will be written (in addition to stdout and "
-        "stderr, if specified)", default=default_log_file)
-    logging_options.add_argument('--log-stdout', help="If this flag is present, then "
-        "logging statements will be written to stdout (in addition to a file "
-        "and stderr, if specified)", action='store_true')
-    logging_options.add_argument('--no-log-stderr', help="Unless this flag is present, then "
-        "logging statements will be written to stderr (in addition to a file "
-        "and stdout, if specified)", action='store_true')
-
-    logging_options.add_argument('--logging-level', help="If this value is specified, "
-        "then it will be used for all logs", choices=logging_level_choices,
-        default=default_logging_level)
-    logging_options.add_argument('--file-logging-level', help="The logging level to be "
-        "used for the log file, if specified. This option overrides "
-        "--logging-level.", choices=logging_level_choices, 
-        default=default_specific_logging_level)
-    logging_options.add_argument('--stdout-logging-level', help="The logging level to be "
-        "used for the stdout log, if specified. This option overrides "
-        "--logging-level.", choices=logging_level_choices, 
-        default=default_specific_logging_level)
-    logging_options.add_argument('--stderr-logging-level', help="The logging level to be "
-        "used for the stderr log, if specified. This option overrides "
-        "--logging-level.", choices=logging_level_choices, 
-        default=default_specific_logging_level)
+    for flags, kwargs in _LOGGING_ACTIONS:
+        logging_options.add_argument(*flags, **kwargs)
+    parser.set_defaults(log_file=default_log_file)
 
 
 def update_logging(args, logger=None, 
@@ -106,44 +140,82 @@ def update_logging(args, logger=None,
         logger = logging.getLogger('')
             
     logger.handlers = []
+    
+    # the same formatter is used for all handlers
+    formatter = logging.Formatter(format_str)
 
     # set the base logging level
-    level = logging.getLevelName(args.logging_level)
+    level = _LOGGING_LEVELS[args.logging_level]
     logger.setLevel(level)
 
     # now, check the specific loggers
-
-    if len(args.log_file) > 0:
-        h = logging.FileHandler(args.log_file)
-        formatter = logging.Formatter(format_str)
+    specific_loggers = [
+        (len(args.log_file) > 0, 
+            functools.partial(logging.FileHandler, args.log_file), 
+            args.file_logging_level),
+        (args.log_stdout, 
+            functools.partial(logging.StreamHandler, sys.stdout), 
+            args.stdout_logging_level),
+        (not args.no_log_stderr, 
+            functools.partial(logging.StreamHandler, sys.stderr), 
+            args.stderr_logging_level)
+    ]
+
+    if args.log_buffer_size > 0:
+        from logging.handlers import MemoryHandler
+
+    for enabled, get_handler, specific_level in specific_loggers:
+        if not enabled:
+            continue
+
+        h = get_handler()
         h.setFormatter(formatter)
-        if args.file_logging_level != 'NOTSET':
-            l = logging.getLevelName(args.file_logging_level)
+        if specific_level != 'NOTSET':
+            l = _LOGGING_LEVELS[specific_level]
             h.setLevel(l)
-        logger.addHandler(h)
 
-    if args.log_stdout:
-        h = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter(format_str)
-        h.setFormatter(formatter)
-        if args.stdout_logging_level != 'NOTSET':
-            l = logging.getLevelName(args.stdout_logging_level)
-            h.setLevel(l)
-        logger.addHandler(h)
+        # buffer the records, these are flushed by logging.shutdown
+        if args.log_buffer_size > 0:
+            h = MemoryHandler(args.log_buffer_size, 
+                              flushLevel=logging.ERROR, 
+                              target=h)
 
-    log_stderr = not args.no_log_stderr
-    if log_stderr:
-        h = logging.StreamHandler(sys.stderr)
-        formatter = logging.Formatter(format_str)
-        h.setFormatter(formatter)
-        if args.stderr_logging_level != 'NOTSET':
-            l = logging.getLevelName(args.stderr_logging_level)
-            h.setLevel(l)
         logger.addHandler(h)
-        
-        
+
+
 # shell
 
+# characters which require a shell to interpret a command string
+_SHELL_METACHARACTERS = re.compile(r'[|&;<>()$`\\"\'*?\[\]{}~#!\n]')
+
+# characters which shlex.split would interpret in a file name
+_SHLEX_CHARACTERS = re.compile(r'[\s"\'\\]')
+
+
+@functools.lru_cache(maxsize=512)
+def _which_cached(program, path):
+    """ Memoized shutil.which, keyed on the program and the search path. 
+        See clear_program_cache.
+    """
+    import shutil
+
+    return shutil.which(program, path=path)
+
+
+@functools.lru_cache(maxsize=128)
+def _find_missing_programs(programs, path):
+    """ Memoized list (tuple) of programs which are not found on path.
+    """
+    return tuple(p for p in programs if _which_cached(p, path) is None)
+
+
+def clear_program_cache():
+    """ Clear the cached program lookups of check_programs_exist, e.g. 
+        after programs were installed or removed.
+    """
+    _find_missing_programs.cache_clear()
+    _which_cached.cache_clear()
+
 
 def check_programs_exist(programs, raise_on_error=True, package_name=None, 
             logger=logger):
@@ -155,7 +227,8 @@ def check_programs_exist(programs, raise_on_error=True, package_name=None,
         available can also be included in the message.
 
         Internally, this program uses shutil.which, so see the documentation
-        for more information about the semantics of calling.
+        for more information about the semantics of calling. Lookups are
+        cached for a given PATH, see clear_program_cache.
 
         Arguments:
             programs (list of string): a list of programs to check
@@ -167,14 +240,9 @@ def check_programs_exist(programs, raise_on_error=True, package_name=None,
             EnvironmentError: if any programs are not callable, then
                 an error is raised listing all uncallable programs.
     """
-    import shutil
-
-    missing_programs = []
-    for program in programs:
-        exe_path = shutil.which(program)
+    path = os.environ.get('PATH', os.defpath)
 
-        if exe_path is None:
-            missing_programs.append(program)
+    missing_programs = list(_find_missing_programs(tuple(programs), path))
 
     if len(missing_programs) > 0:
         missing_programs = ' '.join(missing_programs)
@@ -195,39 +263,101 @@ def check_programs_exist(programs, raise_on_error=True, package_name=None,
 def check_call_step(cmd, current_step = -1, init_step = -1, call=True, 
         raise_on_error=True):
     
-    logging.info(cmd)
-    ret_code = 0
+    """ Execute cmd (see check_call), unless current_step is before 
+        init_step.
+    """
 
     if current_step >= init_step:
-        if call:
-            #logging.info(cmd)
-            logging.info("calling")
-            ret_code = subprocess.call(cmd, shell=True)
-
-            if raise_on_error and (ret_code != 0):
-                raise subprocess.CalledProcessError(ret_code, cmd)
-            elif (ret_code != 0):
-                msg = ("The command returned a non-zero return code\n\t{}\n\t"
-                    "Return code: {}".format(cmd, ret_code))
-                logger.warning(msg)
-        else:
-            msg = "skipping due to --do-not-call flag"
-            logging.info(msg)
-    else:
-        msg = "skipping due to --init-step; {}, {}".format(current_step, init_step)
-        logging.info(msg)
+        return check_call(cmd, call=call, raise_on_error=raise_on_error)
 
-    return ret_code
+    logging.info(cmd if isinstance(cmd, str) else ' '.join(cmd))
+    msg = "skipping due to --init-step; %s, %s"
+    logging.info(msg, current_step, init_step)
+
+    return 0
+
+
+def _check_files(file_checkers, max_workers=8):
+    """ Call each checker function on its file, and return a mapping from 
+        the file names to the results. If there are several files, they 
+        are checked in a thread pool (checkers are typically I/O bound).
+    """
+    def check(filename, checker_function):
+        msg = "Checking file for validity: %s"
+        logger.debug(msg, filename)
 
+        return checker_function(filename, logger=logger, raise_on_error=False)
+
+    if len(file_checkers) < 2:
+        return {f: check(f, c) for f, c in file_checkers.items()}
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    num_workers = min(max_workers, len(file_checkers))
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {f: executor.submit(check, f, c) for f, c in file_checkers.items()}
+    
+    return {f: future.result() for f, future in futures.items()}
 
 
 def check_call(cmd, call=True, raise_on_error=True):
-    return check_call_step(cmd, call=call, raise_on_error=raise_on_error)
+    
+    """ Execute cmd, either a string passed through the shell, or a list
+        of program arguments which is executed directly (no shell). A string
+        without shell syntax (pipes, redirections, variables, globs, quotes,
+        etc.) is split into arguments and also executed directly.
+    """
+    import shlex
+    import subprocess
+
+    # a list of arguments does not need a shell
+    shell_cmd = cmd if isinstance(cmd, str) else None
+    shell = shell_cmd is not None
+    if shell:
+        logging.info(cmd)
+        # nor does a simple command, unless it starts with variable assignment
+        if not _SHELL_METACHARACTERS.search(cmd):
+            args = shlex.split(cmd)
+            if len(args) > 0 and '=' not in args[0]:
+                cmd, shell = args, False
+    else:
+        logging.info(' '.join(cmd))
+    ret_code = 0
+
+    if call:
+        logging.info("calling")
+        try:
+            ret_code = subprocess.call(cmd, shell=shell)
+        except OSError as e:
+            if shell_cmd is None:
+                # as the shell would for a missing program
+                msg = "Could not execute the command: %s"
+                logger.warning(msg, e)
+                ret_code = 127
+            else:
+                # e.g. a shell builtin (cd, export, etc.), let the shell decide
+                ret_code = subprocess.call(shell_cmd, shell=True)
+
+        # report the command as given
+        if shell_cmd is not None:
+            cmd = shell_cmd
+
+        if raise_on_error and (ret_code != 0):
+            raise subprocess.CalledProcessError(ret_code, cmd)
+        elif (ret_code != 0):
+            msg = ("The command returned a non-zero return code\n\t%s\n\t"
+                "Return code: %s")
+            logger.warning(msg, cmd, ret_code)
+    else:
+        msg = "skipping due to --do-not-call flag"
+        logging.info(msg)
+
+    return ret_code
 
 
 def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
             raise_on_error=True, file_checkers=None, num_attempts=1, 
-            to_delete=[], keep_delete_files=False):
+            to_delete=None, keep_delete_files=False, existing_in_files=None):
 
     """ This function checks if out_file exists. If it does not, or if overwrite
         is true, then the command is executed, according to the call flag.
@@ -249,12 +379,13 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
 
         Furthermore, a dictionary can be given which maps from a file name to
         a function which check the integrity of that file. If any of these
-        function calls return False, then the relevant file(s) will be deleted
-        and the call made again. The number of attempts to succeed is given as
-        a parameter to the function.
+        function calls return False, then the relevant file(s) will be renamed
+        (with the suffix .invalid.<attempt>) and the call made again. The 
+        number of attempts to succeed is given as a parameter to the function.
 
         Args:
-            cmd (string): the command to execute
+            cmd (string or list of strings): the command to execute, if
+                a list is given, the program is called without a shell
 
             out_files (string or list of strings): path to the files whose existence 
                 to check. If they do not exist, then the path to them will be 
@@ -281,13 +412,17 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
             num_attempts (int): the number of times to attempt to create the
                 output files such that all of the verifications return True.
 
-            to_delete (list of strings): paths to files to delete if the command
-                is executed successfully
+            to_delete (list of strings or None): paths to files to delete if 
+                the command is executed successfully
 
             keep_delete_files (bool): if this value is True, then the to_delete
                 files will not be deleted, regardless of whether the command
                 succeeded
 
+            existing_in_files (set of strings): paths to input files which are
+                already known to exist, e.g. from a directory listing, their
+                existence is not checked again
+
         Returns:
             int: the return code from the called program
 
@@ -311,20 +446,20 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
 
     ret_code = 0
 
-    # check if the input files exist
-    missing_in_files = []
-    for in_f in in_files:
-        # we need to use shlex to ensure that we remove surrounding quotes in
-        # case the file name has a space, and we are using the quotes to pass
-        # it through shell
-        in_f = shlex.split(in_f)[0]
+    # we need to use shlex to ensure that we remove surrounding quotes in
+    # case the file name has a space, and we are using the quotes to pass
+    # it through shell (plain file names are used as is)
+    in_files_to_check = [shlex.split(in_f)[0] if _SHLEX_CHARACTERS.search(in_f) else in_f 
+                            for in_f in in_files
+                            if existing_in_files is None or in_f not in existing_in_files]
 
-        if not os.path.exists(in_f):
-            missing_in_files.append(in_f)
+    # check if the input files exist
+    missing_in_files = [in_f for in_f in in_files_to_check 
+                            if not os.path.exists(in_f)]
 
     if len(missing_in_files) > 0:
-        msg = "Some input files {} are missing. Skipping call: \n{}".format(missing_in_files, cmd)
-        logger.warn(msg)
+        msg = "Some input files %s are missing. Skipping call: \n%s"
+        logger.warning(msg, missing_in_files, cmd)
         return ret_code
 
         # This is here to create a directory structue using "do_not_call". In
@@ -341,7 +476,7 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
     # check if the output files exist
     all_out_exists = False
     if out_files is not None:
-        all_out_exists = all([os.path.exists(of) for of in out_files])
+        all_out_exists = all(os.path.exists(of) for of in out_files)
 
     all_valid = True
     if overwrite or not all_out_exists:
@@ -349,9 +484,11 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
         while attempt < num_attempts:
             attempt += 1
 
-            # create necessary paths
+            # create necessary paths, once for each directory
             if out_files is not None:
-                [os.makedirs(os.path.dirname(x), exist_ok=True) for x in out_files]
+                for out_dir in {os.path.dirname(x) for x in out_files}:
+                    if out_dir:
+                        os.makedirs(out_dir, exist_ok=True)
             
             # make the call
             ret_code = check_call(cmd, call=call, raise_on_error=raise_on_error)
@@ -360,23 +497,19 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
             if (not call) or (file_checkers is None):
                 break
 
-            # now check the files
+            # now check the files, concurrently if there are several
             all_valid = True
-            for filename, checker_function in file_checkers.items():
-                msg = "Checking file for validity: {}".format(filename)
-                logger.debug(msg)
-
-                is_valid = checker_function(filename, logger=logger, 
-                                raise_on_error=False)
-
+            validity = _check_files(file_checkers)
+            for filename, is_valid in validity.items():
                 # if the file is not valid, then rename it
                 if not is_valid:
                     all_valid = False
-                    invalid_filename = "{}.invalid".format(filename)
-                    msg = "Rename invalid file: {} to {}".format(filename, invalid_filename)
-                    logger.warning(msg)
+                    # keep the invalid file of each attempt
+                    invalid_filename = "{}.invalid.{}".format(filename, attempt)
+                    msg = "Rename invalid file: %s to %s"
+                    logger.warning(msg, filename, invalid_filename)
 
-                    os.rename(filename, invalid_filename)
+                    os.replace(filename, invalid_filename)
 
             # if they were all valid, then we are done
             if all_valid:
@@ -384,8 +517,8 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
 
 
     else:
-        msg = "All output files {} already exist. Skipping call: \n{}".format(out_files, cmd)
-        logger.warn(msg)
+        msg = "All output files %s already exist. Skipping call: \n%s"
+        logger.warning(msg, out_files, cmd)
 
     # now, check if we succeeded in creating the output files
     if not all_valid:
@@ -397,12 +530,12 @@ def call_if_not_exists(cmd, out_files, in_files=[], overwrite=False, call=True,
         else:
             logger.critical(msg)
 
-    elif (not keep_delete_files):
+    elif to_delete and (not keep_delete_files):
         # the command succeeded, so delete the specified files
-        for filename in to_delete:
+        for filename in dict.fromkeys(to_delete):
             if os.path.exists(filename):
-                msg = "Removing file: {}".format(filename)
-                logger.info(cmd)
+                msg = "Removing file: %s"
+                logger.info(msg, filename)
                 
                 os.remove(filename)
 
@@ -432,14 +565,146 @@ def check_keys_exist(d, keys):
         Raises:
             KeyError: if any of the keys are not in the dictionary
     """
-    missing_keys = [k for k in keys if k not in d]
+    missing_keys = set(keys).difference(d)
 
-    
     if len(missing_keys) > 0:
-        missing_keys = ' '.join(missing_keys)
+        # in the order given by keys
+        missing_keys = ' '.join(k for k in keys if k in missing_keys)
         msg = "The following keys were not found: " + missing_keys
         raise KeyError(msg)
 
-    return missing_keys
+    return []
+
+
+def load_yaml(filename):
+    """ This function reads a yaml file, using the libyaml-based loader
+        if it is available. Only standard yaml tags are resolved.
+
+        Args:
+            filename (string): the path to the yaml file
+
+        Returns:
+            the parsed yaml document (typically a dict)
+    """
+    import yaml
+
+    try:
+        from yaml import CSafeLoader as Loader
+    except ImportError:
+        from yaml import SafeLoader as Loader
+
+    with open(filename) as f:
+        return yaml.load(f, Loader=Loader)
+
+
+def read_first_line(filename, sep='\t'):
+    """ This function reads the first line of a BED/bedGraph file, 
+        compressed (gz) or not.
+
+        Args:
+            filename (string): the path to the file
+
+            sep (string): the field separator
+
+        Returns:
+            list of strings: the fields of the first line (header, or 
+                first record if the file has no header)
+    """
+    import gzip
+
+    open_bed = gzip.open if filename.endswith('gz') else open
+    with open_bed(filename, 'rt') as f:
+        return f.readline().rstrip('\n').split(sep)
+
+
+def get_chr_map(args):
+    """ This function combines [--chr-dict] and [--chr-file] into a single 
+        mapping of sequence names. Names given by [--chr-dict] are then mapped 
+        using [--chr-file], as if both were applied one after the other.
+
+        Args:
+            args (namespace): the parsed arguments, with chr_dict (dict or
+                None) and chr_file (string or None, a two-column csv file
+                without header)
+
+        Returns:
+            dict: a mapping from the original to the new sequence names
+    """
+    chr_map = {}
+    if args.chr_file:
+        import pandas as pd
+
+        chr_map = pd.read_csv(args.chr_file, 
+                              header=None,
+                              index_col=0,
+                              dtype=str).squeeze('columns').to_dict()
+    if args.chr_dict:
+        chr_dict = {str(k): str(v) for k, v in args.chr_dict.items()}
+        chr_map.update({k: chr_map.get(v, v) for k, v in chr_dict.items()})
+    
+    return chr_map
+
+
+def map_chrom(chrom_column, chr_map):
+    """ This function renames the sequence names of a pandas series, names
+        not in chr_map are unchanged.
+
+        Args:
+            chrom_column (pd.Series): the sequence names
+
+            chr_map (dict): a mapping of sequence names, see get_chr_map
 
+        Returns:
+            pd.Series: the (categorical) renamed sequence names
+    """
+    # this maps the categories, unless several names are mapped to the same
+    # name, in which case this is not categorical anymore
+    chrom_column = chrom_column.map(lambda c: chr_map.get(c, c))
+    
+    return chrom_column.astype('category')
+
+
+def to_csv(df, filename, sep='\t'):
+    """ This function writes a pandas data frame to filename, without header
+        and index. If pyarrow is installed, the file is written in blocks by 
+        its (C++) CSV writer, otherwise (or if pyarrow is too old to write 
+        without quoting, or if some values would need quoting) pandas is used.
+
+        Args:
+            df (pd.DataFrame): the data frame
+
+            filename (string): the path to the output file
+
+            sep (string): the field separator
+
+        Returns:
+            None
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+
+        # quoting_style is not available in older versions
+        write_options = pacsv.WriteOptions(include_header=False,
+                                           delimiter=sep,
+                                           quoting_style='none')
+    except (ImportError, TypeError):
+        pa = None
+    
+    if pa is not None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        try:
+            pacsv.write_csv(table, filename, write_options=write_options)
+            return
+        except pa.ArrowInvalid:
+            # values with e.g. quotes are not written without quoting,
+            # pandas writes them as is
+            pass
+    
+    import csv
 
+    df.to_csv(filename,
+              sep=sep,
+              index=False,
+              header=False,
+              quoting=csv.QUOTE_NONE)